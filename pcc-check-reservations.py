@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 """pcc-check-reservations.py
 
@@ -21,10 +21,12 @@ cloud-scheduler.cfg attributes:
     reservationSecsLeft: stop PCC when specified secs left in reservation 
 """
 
-from ConfigParser import ConfigParser
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
 from datetime import datetime
 import glob
-from httplib import HTTPConnection
+from http.client import BadStatusLine, HTTPConnection
 import json
 import logging
 from logging.handlers import TimedRotatingFileHandler
@@ -34,12 +36,48 @@ from string import Template
 import socket
 import subprocess
 import sys
+import threading
 import time
 
 ISO_FORMAT="%Y-%m-%dT%H:%M:%S" 
 ISO_LENGTH=19
-
-NODE_TEMPLATE = """
+MAX_WORKERS=10
+
+# Booked session saved across runs; re-authenticate this many secs before
+# it expires
+SESSION_FILE=os.path.expanduser("~/.cache/pcc/booked_session.json")
+SESSION_MARGIN=60
+
+# reservation fields used by this script; the Reservations/ list response
+# may not include all of them
+DETAIL_FIELDS = ( "referenceNumber", "statusId", "resourceId", "startDateTime",
+  "endDateTime", "description", "owner", "resources", "customAttributes" )
+
+# share one SSH connection per remote host across ssh/scp invocations
+SSH_OPTS=["-o", "ControlMaster=auto", "-o", "ControlPath=~/.ssh/cm-%r@%h:%p", "-o", "ControlPersist=60s"]
+
+# regexes used to parse dag, condor submit, vmconf and pragma_boot log files
+RE_DAG_JOB = re.compile( r"\s(\S+)$" )
+RE_FIRST_LINE = re.compile( r"(.*)", re.MULTILINE )
+RE_MACHINE = re.compile( r'Machine =="([^"]+)"', re.MULTILINE )
+RE_USERNAME = re.compile( r"username\s*=\s*(.*)", re.MULTILINE )
+RE_VAR_RUN = re.compile( r"var_run\s*=\s*(\S+)", re.MULTILINE )
+RE_PRAGMA_BOOT_VERSION = re.compile( r"pragma_boot_version\s*=\s*(\S+)", re.MULTILINE )
+RE_PB1_ARG = re.compile( r"(--\S+)\s+=\s+(.*)" )
+RE_PB2_ARG = re.compile( r"--(\S+)\s+=\s+(\S+)" )
+RE_LOG_FQDN = re.compile( r"fqdn=(\S+)*", re.MULTILINE )
+RE_LOG_PUBLIC_IP = re.compile( r"Found available public IP [\d\.]+ -> (\S+)", re.MULTILINE )
+RE_LOG_NUMCPUS = re.compile( r"numcpus=(.+)", re.MULTILINE )
+RE_LOG_REQUESTING_CPUS = re.compile( r"Requesting (\d+) CPUs", re.MULTILINE )
+RE_LOG_CNODES = re.compile( r"cnodes='?([^']+)", re.MULTILINE )
+RE_LOG_COMPUTE_NODES = re.compile( r"Allocated cluster \S+ with compute nodes: (.+)", re.MULTILINE )
+RE_LOG_FRONTEND = re.compile( r"Allocated cluster (\S+)", re.MULTILINE )
+RE_INFO_FQDN = re.compile( r"fqdn=(.*)", re.MULTILINE )
+RE_INFO_CNODES = re.compile( r"cnodes=(.*)", re.MULTILINE )
+RE_WHITESPACE = re.compile( r"\s+" )
+
+# templates are built once and reused for every resource and reservation
+NODE_TEMPLATE = Template("""
 universe                     = vm
 executable                   = rocks_vc_$id
 requirements                 = Machine =="$host"
@@ -55,24 +93,24 @@ var_run                      = $var_run
 rocks_should_transfer_files = Yes
 RunAsOwner=True
 queue
-"""
+""")
 
-VMCONF_TEMPLATE = """--executable      = pragma_boot
+VMCONF_TEMPLATE = Template("""--executable      = pragma_boot
 --key             = $sshKeyPath
 --num_cpus       = $cpus       
 --vcname          = $vcname
 --logfile         = $jobdir/pragma_boot.log
-"""
+""")
 #--enable-ipop-server=http://nbcr-224.ucsd.edu/ipop/exchange.php?jobId=$jobid
 
-EMAIL_STARTING_TEMPLATE = """----- PRAGMA Cloud Scheduler Update @ $date -----
+EMAIL_STARTING_TEMPLATE = Template("""----- PRAGMA Cloud Scheduler Update @ $date -----
 
 Your resource reservation is being started.  You will receive an email when
 the resources are ready for you to login.
 
-"""
+""")
 
-EMAIL_STARTED_TEMPLATE = """----- PRAGMA Cloud Scheduler Update @ $date -----
+EMAIL_STARTED_TEMPLATE = Template("""----- PRAGMA Cloud Scheduler Update @ $date -----
 
 Your resource reservation has been activated: $resourceinfo
 
@@ -80,25 +118,42 @@ To access resources, login to the frontend.  E.g.,
 
 > ssh root@$fqdn
 
-"""
+""")
 
-EMAIL_STOPPING_TEMPLATE = """----- PRAGMA Cloud Scheduler Update @ $date -----
+EMAIL_STOPPING_TEMPLATE = Template("""----- PRAGMA Cloud Scheduler Update @ $date -----
 
 Your resource reservation is being shutdown.
 
-"""
+""")
 
-EMAIL_STOPPED_TEMPLATE = """----- PRAGMA Cloud Scheduler Update @ $date -----
+EMAIL_STOPPED_TEMPLATE = Template("""----- PRAGMA Cloud Scheduler Update @ $date -----
 
 Your resource reservation has been shutdown
 
-"""
+""")
+
+class SessionExpiredError(Exception):
+  """Booked rejected the session token in a request"""
+  pass
+
+# HTTPConnection is not thread safe so each thread keeps its own
+threadLocal = threading.local()
+
+# worker threads live for the whole run so their keep-alive connections are
+# reused by later batches of requests
+executor = ThreadPoolExecutor( max_workers=MAX_WORKERS )
+
+# contents of files already read while processing the current reservation
+fileCache = {}
+
+# serializes re-authentication when workers see the session rejected at once
+sessionLock = threading.Lock()
 
 def query( connection, path, method, params, headers ):
   """Send a REST API request
 
     Args:
-      connection(HTTPConnection): An already open HTTPConnection
+      connection(HTTPConnection): A (possibly reused) HTTPConnection
       path(string): REST API path function
       method(string): POST or GET
       params(string): Arguments to REST function
@@ -107,101 +162,281 @@ def query( connection, path, method, params, headers ):
     Returns:
       JSON object: response from server
   """
-  connection.request( method, path, json.dumps(params), headers )
-  response = connection.getresponse()
+  try:
+    connection.request( method, path, json.dumps(params), headers )
+    response = connection.getresponse()
+  except (BadStatusLine, socket.error):
+    # server dropped an idle keep-alive connection; retry on a fresh socket
+    connection.close()
+    connection.request( method, path, json.dumps(params), headers )
+    response = connection.getresponse()
+  if response.status == 401 and "X-Booked-SessionToken" in headers:
+    response.read()
+    raise SessionExpiredError( "Session rejected querying " + path )
   if response.status != 200:
     sys.stderr.write( "Problem querying " + path + ": " + response.reason )
-    sys.stderr.write( response.read() )
+    sys.stderr.write( response.read().decode() )
     sys.exit(1)
   responsestring = response.read()
   return json.loads( responsestring )
 
+def getConnection( hostname ):
+  """Get the calling thread's keep-alive connection to a server
+
+    Args:
+      hostname(string): Server hostname
+
+    Returns:
+      HTTPConnection: connection that is reused across requests
+  """
+  connection = getattr( threadLocal, "connection", None )
+  if connection is None:
+    connection = HTTPConnection( hostname )
+    threadLocal.connection = connection
+  return connection
+
+def parseIsoTime( isoTime ):
+  """Convert a Booked timestamp to secs since the epoch
+
+    Args:
+      isoTime(string): ISO 8601 time, e.g., 2015-04-24T17:56:43+0000
+
+    Returns:
+      int: secs since the epoch
+  """
+  secs = calendar.timegm( time.strptime(isoTime[:ISO_LENGTH], ISO_FORMAT) )
+  offset = isoTime[ISO_LENGTH:].replace( ":", "" )
+  if len(offset) == 5:
+    offsetSecs = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    if offset[0] == "-":
+      secs += offsetSecs
+    else:
+      secs -= offsetSecs
+  return secs
+
+def loadSession( hostname, username ):
+  """Load the Booked session saved by an earlier run
+
+    Args:
+      hostname(string): Booked hostname
+      username(string): username to authenticate to Booked
+
+    Returns:
+      dict: HTTP header info containing auth data or None if there is no
+        unexpired session for this user
+  """
+  try:
+    with open( SESSION_FILE, 'r' ) as f:
+      session = json.load( f )
+  except (IOError, ValueError):
+    return None
+  if session.get('hostname') != hostname or session.get('username') != username:
+    return None
+  if time.time() >= session.get('expiresAt', 0) - SESSION_MARGIN:
+    return None
+  return session['headers']
+
+def saveSession( hostname, username, headers, expiresAt ):
+  """Save a Booked session for later runs; only readable by the user
+
+    Args:
+      hostname(string): Booked hostname
+      username(string): username to authenticate to Booked
+      headers(dict): HTTP header info containing auth data
+      expiresAt(int): secs since the epoch when session expires
+  """
+  sessionDir = os.path.dirname( SESSION_FILE )
+  os.makedirs( sessionDir, 0o700, exist_ok=True )
+  session = { 
+    'hostname': hostname, 
+    'username': username, 
+    'headers': headers, 
+    'expiresAt': expiresAt 
+  }
+  with os.fdopen( os.open(SESSION_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w' ) as f:
+    json.dump( session, f )
+
+def invalidateSession():
+  """Remove the saved Booked session"""
+  try:
+    os.remove( SESSION_FILE )
+  except FileNotFoundError:
+    pass
+
+def authenticate( hostname, baseUrl, username, password, useSaved=True ):
+  """Authenticate to Booked, reusing the session from an earlier run if any
 
-def queryBooked( config, function, method, params, headers ):
+    Args:
+      hostname(string): Booked hostname
+      baseUrl(string): Path to Booked REST API
+      username(string): username to authenticate to Booked
+      password(string): password to authenticate to Booked
+      useSaved(bool): False to ignore any saved session
+
+    Returns:
+      dict: HTTP header info containing auth data
+  """
+  if useSaved:
+    headers = loadSession( hostname, username )
+    if headers:
+      logging.debug( "Reusing saved Booked session" )
+      return headers
+  connection = getConnection( hostname )
+  creds = { "username": username, "password": password }
+  authUrl = baseUrl + "Authentication/Authenticate"
+  session = query( connection, authUrl, "POST", creds, { "Connection": "keep-alive" } )
+  headers = { 
+    "X-Booked-SessionToken": session['sessionToken'], 
+    "X-Booked-UserId": session['userId'],
+    "Connection": "keep-alive"
+  }
+  if session.get('sessionExpires'):
+    saveSession( hostname, username, headers, parseIsoTime(session['sessionExpires']) )
+  return headers
+
+def queryBooked( hostname, baseUrl, function, method, params, headers ):
   """Send a Booked REST API request
 
+    If Booked rejects the session token, authenticate again, update headers
+    in place so that later requests use the new token, and retry once.
+
     Args:
-      config(ConfigParser): Config file input data
+      hostname(string): Booked hostname
+      baseUrl(string): Path to Booked REST API
       function(string): Name of Booked REST API function
       method(string): POST or GET
       params(string): Arguments to REST function
       headers(string): HTTP header info containing auth data
 
     Returns:
-      dict: contains Booked auth info
       JSON object: response from server
   """
-  connection = HTTPConnection( config.get("Server", "hostname") )
-  connection.connect()
-
-  if headers == None:
-    creds = { 
-        "username": config.get("Authentication", "username"), 
-        "password": config.get("Authentication", "password") 
-    }
-    authUrl = config.get("Server", "baseUrl") + "Authentication/Authenticate"
-    session = query( connection, authUrl, "POST", creds, {} )
-    headers = { 
-      "X-Booked-SessionToken": session['sessionToken'], 
-      "X-Booked-UserId": session['userId']
-    }
-
-  url = config.get("Server", "baseUrl") + function 
-  data = query( connection, url, method, params, headers )
-  connection.close()
-  return (headers, data)
-
-def updateStatus( data, status, config, headers ):
+  connection = getConnection( hostname )
+  rejectedToken = headers["X-Booked-SessionToken"]
+  try:
+    return query( connection, baseUrl + function, method, params, headers )
+  except SessionExpiredError:
+    with sessionLock:
+      # another thread may already have replaced the rejected token
+      if headers["X-Booked-SessionToken"] == rejectedToken:
+        logging.debug( "Booked session was rejected; authenticating again" )
+        invalidateSession()
+        headers.update( authenticate(hostname, baseUrl, CFG["username"], CFG["password"], False) )
+  return query( connection, baseUrl + function, method, params, headers )
+
+def mapConcurrently( func, items ):
+  """Apply a function to each item using a pool of worker threads
+
+    Args:
+      func(function): Function taking a single item; should be I/O bound and
+        must not call mapConcurrently itself, since it runs on the shared pool
+      items(list): Items to pass to func
+
+    Returns:
+      list: results of func, in the same order as items
+  """
+  # a single item is cheaper on the calling thread, which also reuses its
+  # already open connection
+  if len(items) <= 1:
+    return [ func(item) for item in items ]
+  # exceptions raised by func, including sys.exit(), are re-raised here
+  return list( executor.map(func, items) )
+
+def queryBookedConcurrently( hostname, baseUrl, functions, headers ):
+  """Send several Booked REST API GET requests in parallel
+
+    Args:
+      hostname(string): Booked hostname
+      baseUrl(string): Path to Booked REST API
+      functions(list): Names of Booked REST API functions
+      headers(string): HTTP header info containing auth data
+
+    Returns:
+      list: JSON object responses from server, in the same order as functions
+  """
+  return mapConcurrently(
+    lambda function: queryBooked( hostname, baseUrl, function, "GET", None, headers ),
+    functions )
+
+def hasDetails( reservation ):
+  """Check whether reservation data has all fields processed by this script
+
+    Args:
+      reservation(JSON): Reservation JSON data from a list or GET request
+
+    Returns:
+      bool: True if no detail GET request is needed, False otherwise.
+  """
+  return all( field in reservation for field in DETAIL_FIELDS )
+
+def updateStatus( data, status, headers ):
   """Send reservation update request
 
     Args:
       data(JSON): Reservation JSON data from a GET request
       status(string): new status for reservation
-      config(ConfigParser): Config file input data
       headers(string): HTTP header info containing auth data
 
     Returns:
       bool: True if successful, False otherwise.
   """
-  updateData = json.loads(  json.dumps(data) )
-  reformattedAttributes = [];
+  # shallow copy is enough since the nested fields we change are replaced
+  updateData = dict( data )
   # need to reformat attributes to just the ids and values
-  for attr in updateData['customAttributes']:
-    if "id" in attr.keys() and "value" in attr.keys():
-      reformattedAttributes.append( { 
-        'attributeId' : attr['id'],
-        'attributeValue' : attr['value'] } )
-    else:
-      print "Bad attr " + str(attr)
-  updateData['customAttributes'] = reformattedAttributes
+  updateData['customAttributes'] = [ { 
+    'attributeId' : attr['id'],
+    'attributeValue' : attr['value'] }
+    for attr in data['customAttributes'] if "id" in attr and "value" in attr ]
+  if len(updateData['customAttributes']) != len(data['customAttributes']):
+    for attr in data['customAttributes']:
+      if not ("id" in attr and "value" in attr):
+        print( "Bad attr " + str(attr) )
   # need to reformat resources to just the ids
-  reformattedResources = [];
-  for resource in updateData['resources']:
-    reformattedResources.append(resource['id'])
-  updateData['resources'] = reformattedResources
-  updateData['statusId'] = config.get( "Status", status )
-  (headers, responsedata) = queryBooked( config, "Reservations/"+bookedReservation["referenceNumber"], "POST", updateData, headers )
+  updateData['resources'] = [resource['id'] for resource in data['resources']]
+  updateData['statusId'] = CFG["status_" + status]
+  responsedata = queryBooked( CFG["hostname"], CFG["baseUrl"], "Reservations/"+data["referenceNumber"], "POST", updateData, headers )
   logging.debug( "  Server response was: " + responsedata['message'] )
   return responsedata['message'] == 'The reservation was updated'
 
-def runShellCommand( cmd, stdout_filename):
-  """Run bash shell command
+def runCommand( cmd, stdout_filename):
+  """Run command and capture its output
 
     Args:
-      stdout_filename: put stdout in specified filename
+      cmd(list): command and its arguments
+      stdout_filename: put stdout and stderr in specified filename
 
     Returns:
-      exit code of cmd
+      exit code of cmd and its output
   """
+  result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+  writeStringToFile( stdout_filename, result.stdout )
+  return (result.returncode, result.stdout)
+
+def runCommandsConcurrently( cmdLists ):
+  """Run lists of commands in parallel
 
-  stdout_f = open(stdout_filename, "w" )
-  result = subprocess.call(cmd, stdout=stdout_f, shell=True)
-  stdout_f.close()
+    Commands within a list run in order, e.g., a copy followed by a remote
+    command on the same host; the lists themselves run concurrently.
+
+    Args:
+      cmdLists(list): lists of (cmd, output_filename) pairs where cmd is a
+        list of arguments; stdout and stderr are written to output_filename
+        or inherited if it is None
+
+    Returns:
+      list: exit code of the last cmd in each list
+  """
+  def runInOrder( cmds ):
+    result = 0
+    for (cmd, output_filename) in cmds:
+      if output_filename:
+        with open(output_filename, "w" ) as output_f:
+          result = subprocess.call(cmd, stdout=output_f, stderr=subprocess.STDOUT)
+      else:
+        result = subprocess.call(cmd)
+    return result
 
-  f = open(stdout_filename, "r")
-  stdout_text = f.read()
-  f.close()
-  return (result, stdout_text)
+  return mapConcurrently( runInOrder, cmdLists )
 
 def convertAttributesToDict( attrs ):
   """Convert Booked-style attrs to name/value attrs
@@ -217,7 +452,7 @@ def convertAttributesToDict( attrs ):
     dictAttrs[attr['label']] = attr['value']
   return dictAttrs
 
-def writeDag( dagDir, data, config, headers ):
+def writeDag( dagDir, data, headers ):
   """Write a Condor DAG to localdisk 
 
     The following files will be generated:
@@ -231,7 +466,6 @@ def writeDag( dagDir, data, config, headers ):
     Args:
       dagDir(string): Path to directory to store Condor DAGs
       data(JSON): Reservation JSON data from a GET request
-      config(ConfigParser): Config file input data
       headers(string): HTTP header info containing auth data
 
     Returns:
@@ -240,69 +474,74 @@ def writeDag( dagDir, data, config, headers ):
   # get reservation info
   reservAttrs = convertAttributesToDict( data['customAttributes'] )
 
-  # get user info
-  (headers, userdata) = queryBooked( config, "/Users/"+data['owner']['userId'], "GET", None, headers );
-  userAttrs = convertAttributesToDict( userdata['customAttributes'] )
+  # get user and resource info in one parallel round of requests
+  resourceIds = [resource["id"] for resource in data['resources']]
+  functions = ["/Users/"+data['owner']['userId']]
+  functions.extend( ["/Resources/"+resourceId for resourceId in resourceIds] )
+  responses = queryBookedConcurrently( CFG["hostname"], CFG["baseUrl"], functions, headers )
+  userAttrs = convertAttributesToDict( responses[0]['customAttributes'] )
+  resourcesAttrs = {}
+  for (resourceId, resourcedata) in zip(resourceIds, responses[1:]):
+    resourcesAttrs[resourceId] = convertAttributesToDict( resourcedata['customAttributes'] )
 
   # make dag dir and write user's key to disk
   dagDir = os.path.join( dagDir, "dag-" + data["referenceNumber"] )
-  if not os.path.exists(dagDir):
-    logging.debug( "  Creating dag directory " + dagDir )
-    os.makedirs(dagDir)
-    dagDir = os.path.abspath(dagDir)
-  rf = open( '/root/.ssh/id_rsa.pub', 'r' )
-  root_key = rf.read()
-  rf.close()
+  dagDir = os.path.abspath(dagDir)
+  logging.debug( "  Creating dag directory " + dagDir )
+  os.makedirs( dagDir, exist_ok=True )
+  with open( '/root/.ssh/id_rsa.pub', 'r' ) as rf:
+    root_key = rf.read()
   sshKeyPath = os.path.join(dagDir, "public_key")
-  f = open( sshKeyPath, 'w' )
-  logging.debug( "  Writing file " + f.name );
-  f.write(userAttrs['SSH public key'] + "\n");
-  f.write( "%s\n" % root_key );
-  f.close()
+  with open( sshKeyPath, 'w' ) as f:
+    logging.debug( "  Writing file " + f.name );
+    f.write(userAttrs['SSH public key'] + "\n");
+    f.write( "%s\n" % root_key );
 
   # write dag file
-  dag_f = open(os.path.join(dagDir,"dag.sub"), 'w')
-  logging.debug( "  Writing file " + dag_f.name );
+  with open(os.path.join(dagDir,"dag.sub"), 'w') as dag_f:
+    logging.debug( "  Writing file " + dag_f.name );
 
-  # create dag node files for each resource in reervation
-  for resource in data['resources']:
-    dagNodeDir = os.path.join( dagDir, "vc" + resource["id"] )
-    if not os.path.exists(dagNodeDir):
+    # create dag node files for each resource in reervation
+    for resource in data['resources']:
+      dagNodeDir = os.path.join( dagDir, "vc" + resource["id"] )
       logging.debug( "  Creating dag node directory " + dagNodeDir )
-      os.mkdir(dagNodeDir)
-    # get resource info
-    (headers, resourcedata) = queryBooked( config, "/Resources/"+resource["id"], "GET", None, headers );
-    resourceAttrs = convertAttributesToDict( resourcedata['customAttributes'] )
-    f = open(os.path.join(dagNodeDir,"vc"+resource["id"]+".sub"), 'w')
-    logging.debug( "  Writing file " + f.name );
-    dag_f.write( " JOB VC%s  %s\n" % (resource["id"], f.name) )
-    s = Template(NODE_TEMPLATE)
-    f.write(s.substitute(id=resource["id"], host=resourceAttrs['Site hostname'], version=resourceAttrs['Pragma_boot version'], username=resourceAttrs['Username'], var_run=resourceAttrs['Temporary directory'], memory=reservAttrs['Memory (GB)'], jobdir=dagDir))
-    f.close()
-    f = open(os.path.join(dagNodeDir,"vc"+resource["id"]+".vmconf"), 'w')
-    logging.debug( "  Writing file " + f.name );
-    s = Template(VMCONF_TEMPLATE)
-    f.write( s.substitute(cpus=reservAttrs['CPUs'], vcname=reservAttrs['VC Name'], sshKeyPath=sshKeyPath, jobdir=dagDir, jobid=os.getpid()) )
-    f.close()
+      os.makedirs( dagNodeDir, exist_ok=True )
+      resourceAttrs = resourcesAttrs[resource["id"]]
+      with open(os.path.join(dagNodeDir,"vc"+resource["id"]+".sub"), 'w') as f:
+        logging.debug( "  Writing file " + f.name );
+        dag_f.write( " JOB VC%s  %s\n" % (resource["id"], f.name) )
+        f.write(NODE_TEMPLATE.substitute(id=resource["id"], host=resourceAttrs['Site hostname'], version=resourceAttrs['Pragma_boot version'], username=resourceAttrs['Username'], var_run=resourceAttrs['Temporary directory'], memory=reservAttrs['Memory (GB)'], jobdir=dagDir))
+      with open(os.path.join(dagNodeDir,"vc"+resource["id"]+".vmconf"), 'w') as f:
+        logging.debug( "  Writing file " + f.name );
+        f.write( VMCONF_TEMPLATE.substitute(cpus=reservAttrs['CPUs'], vcname=reservAttrs['VC Name'], sshKeyPath=sshKeyPath, jobdir=dagDir, jobid=os.getpid()) )
 
-  # close out dag file
-  dag_f.close()
   return dagDir
 
-def getRegexFromFile( file, regex ):
-  """Grab some strings from a file based on a regex
+def readFile( file ):
+  """Read a file, reusing its contents if already read for this reservation
 
     Args:
-      file(string): Path to file containing string
-      regex(string): Regex to parse from file
+      file(string): Path to file
+
+    Returns:
+      string: contents of file
+  """
+  if file not in fileCache:
+    with open( file, "r" ) as f:
+      fileCache[file] = f.read()
+  return fileCache[file]
+
+def getRegexFromText( text, regex ):
+  """Grab some strings from text based on a regex
+
+    Args:
+      text(string): Text containing string
+      regex(RegexObject): Compiled regex to parse from text
 
     Returns:
       list: Args returned from regex
   """
-  f = open( file, "r" )
-  matcher = re.compile( regex, re.MULTILINE );
-  matched = matcher.search( f.read() )
-  f.close()
+  matched = regex.search( text )
   if not matched:
     return []
   elif len(matched.groups()) == 1:
@@ -310,6 +549,18 @@ def getRegexFromFile( file, regex ):
   else:
     return matched.groups()
 
+def getRegexFromFile( file, regex ):
+  """Grab some strings from a file based on a regex
+
+    Args:
+      file(string): Path to file containing string
+      regex(RegexObject): Compiled regex to parse from file
+
+    Returns:
+      list: Args returned from regex
+  """
+  return getRegexFromText( readFile(file), regex )
+
 def writeStringToFile( file, aString ):
   """Write a string to file
 
@@ -320,9 +571,24 @@ def writeStringToFile( file, aString ):
     Returns:
       bool: True if success otherwise false
   """
-  f = open( file, 'w' )
-  f.write( aString )
-  return f.close()
+  fileCache.pop( file, None )
+  with open( file, 'w' ) as f:
+    f.write( aString )
+
+def iterDagJobs( dagDir ):
+  """Iterate over the condor submit files of the jobs in a dag
+
+    Args:
+      dagDir(string): Path to directory containing dag.sub
+
+    Returns:
+      generator: path of each job's submit file
+  """
+  with open( os.path.join(dagDir, 'dag.sub'), 'r' ) as subf:
+    for line in subf:
+      matched = RE_DAG_JOB.search( line )
+      if matched:
+        yield matched.group(1)
 
 def isDagRunning( dagDir, refNumber ):
   """Check to see if dag is running
@@ -334,88 +600,97 @@ def isDagRunning( dagDir, refNumber ):
       bool: True if dag is running, False otherwise.
   """
   (active, inactive, resourceinfo, frontendFqdn) = ([], [], "", "")
-  subf = open( os.path.join(dagDir, 'dag.sub'), 'r' )
-  for line in subf:
-    matched = re.match( ".*\s(\S+)$", line )
-    if matched:
-      vcdir = os.path.dirname( matched.group(1) )
-      hostname = getRegexFromFile( os.path.join(vcdir, "hostname"), "(.*)" )
-      [conf] = glob.glob(os.path.join(vcdir, "*.sub"))
-      username = getRegexFromFile( conf, "username\s*=\s*(.*)" )
-      var_run = getRegexFromFile( conf, "var_run\s*=\s*(.*)" )
-      pragma_boot_version = getRegexFromFile( conf, "pragma_boot_version\s*=\s*(.*)" )
-      remoteDagDir = os.path.join( var_run, "dag-%s" % refNumber )
-      cluster_info_filename = os.path.join(vcdir, "cluster_info");
-      (cluster_fqdn, nodes) = ("", [])
-      if not os.path.exists( cluster_info_filename ):
-        scp = 'scp %s@%s:%s %s >& /dev/null' % (username, hostname, os.path.join(remoteDagDir,"pragma_boot.log"), vcdir)
-        logging.debug( "  %s" % scp )
-        subprocess.call( scp, shell=True)
-        cluster_fqdn = getRegexFromFile( os.path.join(vcdir,"pragma_boot.log"), 'fqdn=(\S+)*' )
+  vcs = []
+  for vcfile in iterDagJobs( dagDir ):
+    vcdir = os.path.dirname( vcfile )
+    hostname = getRegexFromFile( os.path.join(vcdir, "hostname"), RE_FIRST_LINE )
+    [conf] = glob.glob(os.path.join(vcdir, "*.sub"))
+    confText = readFile( conf )
+    username = getRegexFromText( confText, RE_USERNAME )
+    var_run = getRegexFromText( confText, RE_VAR_RUN )
+    pragma_boot_version = getRegexFromText( confText, RE_PRAGMA_BOOT_VERSION )
+    remoteDagDir = os.path.join( var_run, "dag-%s" % refNumber )
+    vcs.append( (vcdir, hostname, username, pragma_boot_version, remoteDagDir) )
+
+  # fetch pragma_boot logs for all clusters not yet described in parallel
+  scps = []
+  for (vcdir, hostname, username, pragma_boot_version, remoteDagDir) in vcs:
+    if not os.path.exists( os.path.join(vcdir, "cluster_info") ):
+      scp = ["scp"] + SSH_OPTS + ["%s@%s:%s" % (username, hostname, os.path.join(remoteDagDir,"pragma_boot.log")), vcdir]
+      logging.debug( "  %s" % " ".join(scp) )
+      scps.append( [(scp, os.devnull)] )
+  runCommandsConcurrently( scps )
+
+  checks = []
+  for (vcdir, hostname, username, pragma_boot_version, remoteDagDir) in vcs:
+    cluster_info_filename = os.path.join(vcdir, "cluster_info");
+    (cluster_fqdn, nodes) = ("", [])
+    if not os.path.exists( cluster_info_filename ):
+      logText = readFile( os.path.join(vcdir,"pragma_boot.log") )
+      cluster_fqdn = getRegexFromText( logText, RE_LOG_FQDN )
+      if not cluster_fqdn:
+        cluster_fqdn = getRegexFromText( logText, RE_LOG_PUBLIC_IP )
         if not cluster_fqdn:
-          cluster_fqdn = getRegexFromFile( os.path.join(vcdir,"pragma_boot.log"), 'Found available public IP [\d\.]+ -> (\S+)' )
-          if not cluster_fqdn:
-            logging.info( "   No FQDN info available yet" )
-            return False
-        nodes.append( cluster_fqdn.split(".")[0] )
+          logging.info( "   No FQDN info available yet" )
+          return False
+      nodes.append( cluster_fqdn.split(".")[0] )
+      try:
+        numcpus = int(getRegexFromText( logText, RE_LOG_NUMCPUS ) )
+      except:
+        numcpus = int(getRegexFromText( logText, RE_LOG_REQUESTING_CPUS ) )
+      cnodes = ""
+      if numcpus > 0:
         try:
-          numcpus = int(getRegexFromFile( os.path.join(vcdir,"pragma_boot.log"), 'numcpus=(.+)' ) )
+          cnodes = getRegexFromText( logText, RE_LOG_CNODES )
+          cnodes_array = cnodes.split( "\n" )
         except:
-          numcpus = int(getRegexFromFile( os.path.join(vcdir,"pragma_boot.log"), 'Requesting (\d+) CPUs' ) )
-        cnodes = ""
-        if numcpus > 0:
-          try:
-            cnodes = getRegexFromFile( os.path.join(vcdir,"pragma_boot.log"), "cnodes='?([^']+)" )
-            cnodes_array = cnodes.split( "\n" )
-          except:
-            cnodes = getRegexFromFile( os.path.join(vcdir,"pragma_boot.log"), "Allocated cluster \S+ with compute nodes: (.+)" )
-            cnodes_array = cnodes.split( ", " )
-          if not cnodes:
-            logging.info( "   No compute nodes info available yet" )
-            continue
-          nodes.extend( cnodes_array )
-          cnodes = " ".join(cnodes_array)
-        writeStringToFile( os.path.join(vcdir, "cluster_info"), "fqdn=%s\ncnodes=%s" % (cluster_fqdn, cnodes) ) 
-      else:
-        logging.debug( "  Reading %s" % cluster_info_filename )
-        cluster_fqdn = getRegexFromFile( cluster_info_filename, "fqdn=(.*)" )
-        nodes.append( cluster_fqdn.split(".")[0] )
-        cnodes = getRegexFromFile( cluster_info_filename, "cnodes=(.*)" )
-        if len(cnodes) > 0:
-          nodes.extend( re.split("\s+", cnodes) )
-
-      frontendFqdn = cluster_fqdn
-      resourceinfo += "\n\nFrontend: %s\nNumber of compute nodes: %d" % (cluster_fqdn, len(nodes)-1);
-
-      if pragma_boot_version == "2":
-        frontend = getRegexFromFile( os.path.join(vcdir,"pragma_boot.log"), 'Allocated cluster (\S+)' )
-        ssh = 'ssh %s@%s /opt/python/bin/python /opt/pragma_boot/bin/pragma list cluster %s' % (username, hostname, frontend)
-        pragma_status_filename =  os.path.join( vcdir, "pragma_list_cluster" )
-        stdout_f = open(pragma_status_filename, "w" )
-        result = subprocess.call(ssh, stdout=stdout_f, shell=True)
-        stdout_f.close()
-        if result == 0:
-          active.append(frontend)
-        else:
-          inactive.append(frontend)
-        f = open(pragma_status_filename, "r")
-        status = f.read()
-        f.close()
-        logging.info("   %s" % status)
-      else:
-        ping = 'ping -c 1 %s >& /dev/null' % cluster_fqdn
-        ping_status = subprocess.call(ping, shell=True)
-        logging.debug( "  Ping to '%s': %i" % (cluster_fqdn, ping_status) )
-        if ping_status == 0:
-          active.append(cluster_fqdn)
-        else:
-          inactive.append(cluster_fqdn)
+          cnodes = getRegexFromText( logText, RE_LOG_COMPUTE_NODES )
+          cnodes_array = cnodes.split( ", " )
+        if not cnodes:
+          logging.info( "   No compute nodes info available yet" )
+          continue
+        nodes.extend( cnodes_array )
+        cnodes = " ".join(cnodes_array)
+      writeStringToFile( os.path.join(vcdir, "cluster_info"), "fqdn=%s\ncnodes=%s" % (cluster_fqdn, cnodes) ) 
+    else:
+      logging.debug( "  Reading %s" % cluster_info_filename )
+      infoText = readFile( cluster_info_filename )
+      cluster_fqdn = getRegexFromText( infoText, RE_INFO_FQDN )
+      nodes.append( cluster_fqdn.split(".")[0] )
+      cnodes = getRegexFromText( infoText, RE_INFO_CNODES )
+      if len(cnodes) > 0:
+        nodes.extend( RE_WHITESPACE.split(cnodes) )
+
+    frontendFqdn = cluster_fqdn
+    resourceinfo += "\n\nFrontend: %s\nNumber of compute nodes: %d" % (cluster_fqdn, len(nodes)-1);
+
+    if pragma_boot_version == "2":
+      frontend = getRegexFromFile( os.path.join(vcdir,"pragma_boot.log"), RE_LOG_FRONTEND )
+      if not frontend:
+        logging.info( "   No frontend name found for %s" % cluster_fqdn )
+        inactive.append( cluster_fqdn )
+        continue
+      ssh = ["ssh"] + SSH_OPTS + ["%s@%s" % (username, hostname), "/opt/python/bin/python", "/opt/pragma_boot/bin/pragma", "list", "cluster", frontend]
+      checks.append( (frontend, ssh, os.path.join(vcdir, "pragma_list_cluster")) )
+    else:
+      ping = ["ping", "-c", "1", cluster_fqdn]
+      checks.append( (cluster_fqdn, ping, os.devnull) )
+
+  # check clusters in parallel
+  results = runCommandsConcurrently( [[(cmd, output_filename)] for (name, cmd, output_filename) in checks] )
+  for ((name, cmd, output_filename), result) in zip(checks, results):
+    if result == 0:
+      active.append(name)
+    else:
+      inactive.append(name)
+    if output_filename != os.devnull:
+      logging.info("   %s" % readFile(output_filename))
+    else:
+      logging.debug( "  Ping to '%s': %i" % (name, result) )
   logging.info( "   Active clusters: %s" % str(active) )
   logging.info( "   Inactive clusters: %s" % str(inactive) )
-  subf.close()
   if len(inactive) == 0:
-    s = Template(EMAIL_STARTED_TEMPLATE)
-    return s.substitute(date=str(datetime.now()), resourceinfo=resourceinfo, fqdn=frontendFqdn)
+    return EMAIL_STARTED_TEMPLATE.substitute(date=NOW_STR, resourceinfo=resourceinfo, fqdn=frontendFqdn)
   return None
 
 def startDagPB( dagDir, refNumber ):
@@ -428,50 +703,49 @@ def startDagPB( dagDir, refNumber ):
     Returns:
       bool: True if writes successful, False otherwise.
   """
-  local_hostname = socket.gethostname()
-  subf = open( os.path.join(dagDir, 'dag.sub'), 'r' )
-  for line in subf:
-    matched = re.match( ".*\s(\S+)$", line )
-    if matched:
-      vcfile = matched.group(1)
-      hostname = getRegexFromFile( vcfile, 'Machine =="([^"]+)"' )
-      username = getRegexFromFile( vcfile, "username\s*=\s*(.*)" )
-      pragma_boot_version = getRegexFromFile( vcfile, "pragma_boot_version\s*=\s*(\S+)" )
-      var_run = getRegexFromFile( vcfile, "var_run\s*=\s*(\S+)" )
-      remoteDagDir = os.path.join( var_run, "dag-%s" % refNumber )
-
-      host_f = open( os.path.join(os.path.dirname(vcfile), "hostname"), 'w' )
-      host_f.write( hostname )
-      host_f.close()
-      if hostname != local_hostname: 
-        logging.debug( "  Copying dir %s over to %s:%s " % (dagDir,hostname, remoteDagDir) )
-        subprocess.call('ssh %s@%s mkdir -p %s' % (username, hostname, var_run), shell=True)
-        subprocess.call('scp -r %s %s@%s:%s >& /dev/null' % (dagDir, username, hostname, remoteDagDir), shell=True)
-      vmconf_file = vcfile.replace( '.sub', '.vmconf' )
-      vmf = open( vmconf_file, 'r' );
-      args = ""
-      cmdline = ""
-      if pragma_boot_version == "1":
-        for line in vmf:
-          matched = re.match( "(--\S+)\s+=\s+(.*)", line )
-          if matched and matched.group(1) != '--executable' and matched.group(1) != '--logfile':
-            value = matched.group(2)
-            value = value.replace(dagDir, remoteDagDir)
-            args += " %s=%s" % (matched.group(1), value)
-        cmdline = "ssh -f %s@%s 'cd %s; /opt/pragma_boot/bin/pragma_boot %s' >& %s/ssh.out" % (username, hostname, remoteDagDir, args, dagDir)
-      elif pragma_boot_version == "2":
-        args = {}
-        for line in vmf:
-          matched = re.match( "--(\S+)\s+=\s+(\S+)", line )
-          args[matched.group(1)] = matched.group(2)
-        args["key"] = args["key"].replace(dagDir, remoteDagDir)
-        cmdline = "ssh -f %s@%s 'cd %s; /opt/python/bin/python /opt/pragma_boot/bin/pragma boot %s %s key=%s loglevel=DEBUG logfile=%s' >& %s/ssh.out" % (username, hostname, dagDir, args["vcname"], args["num_cpus"], args["key"], args["logfile"], dagDir)
-      else:
-        logging.error("Error, unknown pragma_boot version %s" % pragma_boot_version)
-        sys.exit(1)
-      logging.debug( "  Running pragma_boot: %s" % cmdline )
-      subprocess.call(cmdline, shell=True)
-  subf.close()
+  cmdLists = []
+  for vcfile in iterDagJobs( dagDir ):
+    vcText = readFile( vcfile )
+    hostname = getRegexFromText( vcText, RE_MACHINE )
+    username = getRegexFromText( vcText, RE_USERNAME )
+    pragma_boot_version = getRegexFromText( vcText, RE_PRAGMA_BOOT_VERSION )
+    var_run = getRegexFromText( vcText, RE_VAR_RUN )
+    remoteDagDir = os.path.join( var_run, "dag-%s" % refNumber )
+
+    writeStringToFile( os.path.join(os.path.dirname(vcfile), "hostname"), hostname )
+    cmds = []
+    if hostname != LOCAL_HOST: 
+      logging.debug( "  Copying dir %s over to %s:%s " % (dagDir,hostname, remoteDagDir) )
+      cmds.append( (["ssh"] + SSH_OPTS + ["%s@%s" % (username, hostname), "mkdir", "-p", var_run], None) )
+      cmds.append( (["scp"] + SSH_OPTS + ["-r", dagDir, "%s@%s:%s" % (username, hostname, remoteDagDir)], os.devnull) )
+    vmconf_file = vcfile.replace( '.sub', '.vmconf' )
+    with open( vmconf_file, 'r' ) as vmf:
+      vmconf_lines = vmf.readlines()
+    args = ""
+    cmdline = ""
+    if pragma_boot_version == "1":
+      for line in vmconf_lines:
+        matched = RE_PB1_ARG.match( line )
+        if matched and matched.group(1) != '--executable' and matched.group(1) != '--logfile':
+          value = matched.group(2)
+          value = value.replace(dagDir, remoteDagDir)
+          args += " %s=%s" % (matched.group(1), value)
+      cmdline = ["ssh"] + SSH_OPTS + ["-f", "%s@%s" % (username, hostname), "cd %s; /opt/pragma_boot/bin/pragma_boot %s" % (remoteDagDir, args)]
+    elif pragma_boot_version == "2":
+      args = {}
+      for line in vmconf_lines:
+        matched = RE_PB2_ARG.match( line )
+        args[matched.group(1)] = matched.group(2)
+      args["key"] = args["key"].replace(dagDir, remoteDagDir)
+      cmdline = ["ssh"] + SSH_OPTS + ["-f", "%s@%s" % (username, hostname), "cd %s; /opt/python/bin/python /opt/pragma_boot/bin/pragma boot %s %s key=%s loglevel=DEBUG logfile=%s" % (dagDir, args["vcname"], args["num_cpus"], args["key"], args["logfile"])]
+    else:
+      logging.error("Error, unknown pragma_boot version %s" % pragma_boot_version)
+      sys.exit(1)
+    logging.debug( "  Running pragma_boot: %s" % " ".join(cmdline) )
+    cmds.append( (cmdline, os.path.join(os.path.dirname(vcfile), "ssh.out")) )
+    cmdLists.append( cmds )
+  # copy and boot on each resource in parallel
+  runCommandsConcurrently( cmdLists )
   logging.debug( "  Sleeping 10 seconds" )
   time.sleep(10)
   return True
@@ -486,38 +760,56 @@ def stopDagPB( dagDir, refNumber ):
     Returns:
       bool: True if writes successful, False otherwise.
   """
-  local_hostname = socket.gethostname()
-  subf = open( os.path.join(dagDir, 'dag.sub'), 'r' )
-  for line in subf:
-    matched = re.match( ".*\s(\S+)$", line )
-    if matched:
-      vcfile = matched.group(1)
-      vcdir = os.path.dirname( matched.group(1) )
-      hostname = getRegexFromFile( vcfile, 'Machine =="([^"]+)"' )
-      username = getRegexFromFile( vcfile, "username\s*=\s*(.*)" )
-      frontend = getRegexFromFile( os.path.join(dagDir,"pragma_boot.log"), 'Allocated cluster (\S+)' )
-      ssh_pragma = "ssh %s@%s /opt/python/bin/python /opt/pragma_boot/bin/pragma" % (username, hostname)
-      shutdown_cmd = "%s shutdown %s" % (ssh_pragma, frontend)
-      logger.debug("  Shutting down %s: %s" % (frontend, shutdown_cmd))
-      (result, stdout_text) = runShellCommand(shutdown_cmd, os.path.join(vcdir, "pragma_shutdown"))
-      if result != 0:
-        logger.error("  Error shutting down virtual cluster %s" % frontend)
-        return False
-      logger.debug("  %s" % stdout_text)
-      clean_cmd = "%s clean %s" % (ssh_pragma, frontend)
-      logger.debug("  Cleaning %s: %s" % (frontend, clean_cmd))
-      (result, stdout_text) = runShellCommand(clean_cmd, os.path.join(vcdir, "pragma_clean"))
-      logger.debug("  %s" % stdout_text)
-      if result != 0:
-        logger.error("  Error cleaning virtual cluster %s" % frontend)
-        return False
-  return True
+  def stopVC( vc ):
+    (vcdir, ssh_pragma, frontend) = vc
+    if not frontend:
+      logger.error("  No frontend name found for virtual cluster in %s" % vcdir)
+      return False
+    shutdown_cmd = ssh_pragma + ["shutdown", frontend]
+    logger.debug("  Shutting down %s: %s" % (frontend, " ".join(shutdown_cmd)))
+    (result, stdout_text) = runCommand(shutdown_cmd, os.path.join(vcdir, "pragma_shutdown"))
+    if result != 0:
+      logger.error("  Error shutting down virtual cluster %s" % frontend)
+      return False
+    logger.debug("  %s" % stdout_text)
+    clean_cmd = ssh_pragma + ["clean", frontend]
+    logger.debug("  Cleaning %s: %s" % (frontend, " ".join(clean_cmd)))
+    (result, stdout_text) = runCommand(clean_cmd, os.path.join(vcdir, "pragma_clean"))
+    logger.debug("  %s" % stdout_text)
+    if result != 0:
+      logger.error("  Error cleaning virtual cluster %s" % frontend)
+      return False
+    return True
+
+  vcs = []
+  for vcfile in iterDagJobs( dagDir ):
+    vcdir = os.path.dirname( vcfile )
+    vcText = readFile( vcfile )
+    hostname = getRegexFromText( vcText, RE_MACHINE )
+    username = getRegexFromText( vcText, RE_USERNAME )
+    frontend = getRegexFromFile( os.path.join(dagDir,"pragma_boot.log"), RE_LOG_FRONTEND )
+    ssh_pragma = ["ssh"] + SSH_OPTS + ["%s@%s" % (username, hostname), "/opt/python/bin/python", "/opt/pragma_boot/bin/pragma"]
+    vcs.append( (vcdir, ssh_pragma, frontend) )
+  # shut down each resource in parallel
+  return all( mapConcurrently(stopVC, vcs) )
 
 # read input arguments from property file
 config = ConfigParser()
 config.read("cloud-scheduler.cfg");
 reservationSecsLeft = int( config.get( "Stopping", "reservationSecsLeft" ) );
 
+# cache config values used per request or per reservation; ConfigParser
+# lookups are comparatively expensive
+CFG = {
+  "hostname": config.get("Server", "hostname"),
+  "baseUrl": config.get("Server", "baseUrl"),
+  "dagDir": config.get("Server", "dagDir"),
+  "username": config.get("Authentication", "username"),
+  "password": config.get("Authentication", "password")
+}
+for (name, value) in config.items("Status"):
+  CFG["status_" + name] = value
+
 # configure logging 
 logger = logging.getLogger()
 logger.setLevel( config.get("Logging", "level") )
@@ -531,61 +823,81 @@ logger.addHandler(handler)
 
 # Examine all reservations and determine which require actions
 logging.debug( "Reading current and future reservations" )
-(headers, data) = queryBooked( config, "Reservations/", "GET", None, None );
+headers = authenticate( CFG["hostname"], CFG["baseUrl"], CFG["username"], CFG["password"] )
+data = queryBooked( CFG["hostname"], CFG["baseUrl"], "Reservations/", "GET", None, headers );
 
 # if reservation contains more than one resource, one entry is returned for
 # each; we just need one
-bookedReservations = {}
-for bookedReservation in data["reservations"]:
-  bookedReservations[bookedReservation['referenceNumber']] = bookedReservation
+bookedReservations = { r['referenceNumber']: r for r in data["reservations"] }
+
+# Timestamp and hostname used for the whole pass so that all status
+# updates sent in one run agree
+NOW = datetime.now()
+NOW_STR = NOW.isoformat( sep=' ', timespec='seconds' )
+LOCAL_HOST = socket.gethostname()
+
+# Running reservations with time left need no action; when the list entry
+# says so, skip them without fetching their details
+for (refNumber, r) in list( bookedReservations.items() ):
+  if r.get('statusId') == CFG["status_running"] and 'endDateTime' in r:
+    endDiff = datetime.strptime( r['endDateTime'][:ISO_LENGTH], ISO_FORMAT ) - NOW
+    if endDiff.total_seconds() > reservationSecsLeft:
+      shutdownTime = endDiff.total_seconds() - reservationSecsLeft
+      logging.debug( "Reservation: ref=%s, status=%s" % (refNumber, r['statusId']) )
+      logging.debug( "  Reservation scheduled to be shut down in %s or %d secs" % (str(endDiff), shutdownTime) )
+      del bookedReservations[refNumber]
+
+# Fetch details in parallel for unique reservations whose list entry is
+# missing fields we need
+refNumbers = [refNumber for (refNumber, r) in bookedReservations.items() if not hasDetails(r)]
+fetched = queryBookedConcurrently( CFG["hostname"], CFG["baseUrl"], ["Reservations/"+refNumber for refNumber in refNumbers], headers )
+for (refNumber, reservation) in zip(refNumbers, fetched):
+  bookedReservations[refNumber] = reservation
+details = list( bookedReservations.values() )
 
 # Iterate thru unique reservations
-for bookedReservation in bookedReservations.values():
-  (headers, data) = queryBooked( config, "Reservations/"+bookedReservation["referenceNumber"], "GET", None, headers );
+for data in details:
+  fileCache.clear()
   # Gather reservation data info
-  logging.debug( "Reservation: ref=%s, status=%s, resourceId=%s" % (bookedReservation["referenceNumber"], data['statusId'], data['resourceId']) )
+  logging.debug( "Reservation: ref=%s, status=%s, resourceId=%s" % (data["referenceNumber"], data['statusId'], data['resourceId']) )
   startTime = datetime.strptime( data['startDateTime'][:ISO_LENGTH], ISO_FORMAT )
   endTime = datetime.strptime( data['endDateTime'][:ISO_LENGTH], ISO_FORMAT )
-  now = datetime.now()
   logging.debug( "  Start: " + data['startDateTime'] + ", End: " + data['endDateTime'] ) 
-  startDiff = startTime - now
-  endDiff = endTime - now
+  startDiff = startTime - NOW
+  endDiff = endTime - NOW
 
   # Reservation needs to be started
-  if ( config.get("Status", "created") == data['statusId'] ):
+  if ( CFG["status_created"] == data['statusId'] ):
     logging.debug( "  Reservation should be started in: " + str(startDiff) )
     if startDiff.total_seconds() <= 0: # should be less than
-      logging.info( "   Starting reservation at " + str(datetime.now()) )
-      dagDir = writeDag( config.get("Server", "dagDir"), data, config, headers )
+      logging.info( "   Starting reservation at " + NOW_STR )
+      dagDir = writeDag( CFG["dagDir"], data, headers )
       startDagPB( dagDir, data["referenceNumber"] )
-      s = Template(EMAIL_STARTING_TEMPLATE)
-      data['description'] += "\n\n%s" % s.substitute(date=str(datetime.now()))
-      updateStatus( data, "starting", config, headers )
+      data['description'] += "\n\n%s" % EMAIL_STARTING_TEMPLATE.substitute(date=NOW_STR)
+      updateStatus( data, "starting", headers )
   # else Reservation is starting
-  elif config.get("Status", "starting") == data['statusId']: 
+  elif CFG["status_starting"] == data['statusId']: 
     logging.info( "   Checking status of reservation " )
-    dagDir = os.path.join( config.get("Server", "dagDir"), "dag-" + data["referenceNumber"] )
+    dagDir = os.path.join( CFG["dagDir"], "dag-" + data["referenceNumber"] )
     info = isDagRunning( dagDir, data["referenceNumber"] )
     if info:
       logging.info( "   Reservation is running" )
       data['description'] += "\n\n%s" % info
-      updateStatus( data, "running", config, headers ) 
+      updateStatus( data, "running", headers ) 
   # else Reservation is running
-  elif ( config.get("Status", "running") == data['statusId'] and endDiff.total_seconds() > reservationSecsLeft ):
+  elif ( CFG["status_running"] == data['statusId'] and endDiff.total_seconds() > reservationSecsLeft ):
     # <insert pcc check to make sure is true>
     shutdownTime = endDiff.total_seconds() - reservationSecsLeft
     logging.debug( "  Reservation scheduled to be shut down in %s or %d secs" % (str(endDiff), shutdownTime) )
   # else Reservation is running and needs to be shut down
-  elif ( config.get("Status", "running") == data['statusId'] and endDiff.total_seconds() <= reservationSecsLeft ):
+  elif ( CFG["status_running"] == data['statusId'] and endDiff.total_seconds() <= reservationSecsLeft ):
     logging.debug( "  Reservation has expired; shutting down cluster" )
-    s = Template(EMAIL_STOPPING_TEMPLATE)
-    data['description'] += "\n\n%s" % s.substitute(date=str(datetime.now()))
-    updateStatus(data, "stopping",config, headers )
-    dagDir = os.path.join( config.get("Server", "dagDir"), "dag-" + data["referenceNumber"] )
+    data['description'] += "\n\n%s" % EMAIL_STOPPING_TEMPLATE.substitute(date=NOW_STR)
+    updateStatus(data, "stopping", headers )
+    dagDir = os.path.join( CFG["dagDir"], "dag-" + data["referenceNumber"] )
     if stopDagPB(dagDir, data["referenceNumber"]):
-      s = Template(EMAIL_STOPPED_TEMPLATE)
-      data['description'] += "\n\n%s" % s.substitute(date=str(datetime.now()))
-      updateStatus( data, "created", config, headers ) 
+      data['description'] += "\n\n%s" % EMAIL_STOPPED_TEMPLATE.substitute(date=NOW_STR)
+      updateStatus( data, "created", headers ) 
   # else reservation is active/future and unknown state
   else:
     logging.debug( "  Reservation in unknown state to PCC" )